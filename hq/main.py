@@ -1,14 +1,19 @@
 import asyncio
+import contextlib
 import logging
+import os
 import random
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+from typing import Annotated
 
 import aiosqlite
+import msgspec
 from fastapi import FastAPI, Request, HTTPException, status
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
 
 # --- LOGGING SETUP ---
 logging.basicConfig(
@@ -20,17 +25,92 @@ logger = logging.getLogger("HQ")
 
 # --- CONFIGURATION ---
 DB_FILE = "telemetry.db"
-CHAOS_MODE = True  # Set to False to disable the simulation
+# CHAOS_MODE=0/false/off/no disables the simulation
+CHAOS_MODE = os.getenv("CHAOS_MODE", "1").strip().lower() not in (
+    "0",
+    "false",
+    "off",
+    "no",
+)
 MIN_UP_TIME = 5
 MAX_UP_TIME = 10
 MIN_DOWN_TIME = 3
 MAX_DOWN_TIME = 7
+FLUSH_INTERVAL = 0.25  # Seconds between batch writes
+FLUSH_BATCH_SIZE = 500  # Max readings written per transaction
+PENDING_MAX_SIZE = 10_000  # Queued readings before /telemetry pushes back with 503
+ANALYZE_INTERVAL = 900  # Seconds between planner statistics refreshes
+ANALYSIS_LIMIT = 1000  # Rows sampled per index by ANALYZE (PRAGMA analysis_limit)
+# Daily readings tables older than this are dropped; RETENTION_DAYS=0 keeps all
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "30"))
+RETENTION_INTERVAL = 3600  # Seconds between retention sweeps
+
+# Applied on every connection open. The writer also switches the file to WAL
+# (persistent), so the /stats reader runs alongside the /telemetry writer and
+# synchronous=NORMAL only fsyncs on checkpoints.
+SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",  # ~20 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MiB memory-mapped reads
+)
 
 templates = Jinja2Templates(directory="templates")
 
+# --- HTML FRAGMENTS ---
+# /stats is polled every second, so it is built with str.format instead of Jinja2.
+STATS_COUNT_ROW = """<div class="stat-row">
+    <span class="label">Total Packets Received:</span>
+    <span class="value">{count}</span>
+</div>
+"""
+STATS_STATUS_ROW = """
+<div style="text-align: center; margin-top: 20px; font-size: 0.8rem; color: #888;">
+    Status: <span style="color: {status_color}">{status}</span>
+</div>
+"""
+STATS_TEMPLATE = (
+    STATS_COUNT_ROW
+    + """
+<div class="stat-row">
+    <span class="label">Last Signal Time:</span>
+    <span class="value">{timestamp}</span>
+</div>
+<div class="stat-row">
+    <span class="label">Temperature:</span>
+    <span class="value" style="color: {temp_color}">
+        {temperature}°C
+    </span>
+</div>
+<div class="stat-row">
+    <span class="label">Battery:</span>
+    <span class="value">{battery_level}%</span>
+</div>
+"""
+    + STATS_STATUS_ROW
+)
+STATS_WAITING_TEMPLATE = (
+    STATS_COUNT_ROW
+    + """
+<div style="text-align: center; color: yellow;">Waiting for first contact...</div>
+"""
+    + STATS_STATUS_ROW
+)
+
 # --- GLOBAL STATE ---
-db_connection = None
+db_connection = None  # Writer: sqlite3, only used on db_writer_thread
+db_writer_thread = None  # Single-thread executor that owns db_connection
+db_reader = None  # Read-only: dashboard queries
+pending_readings = None  # asyncio.Queue of rows waiting for the batch writer
+retry_batch = []  # Batch whose write failed; retried before draining the queue
+flusher_stop = None  # asyncio.Event that ends flusher_loop on shutdown
+row_count = 0  # Rows across all readings tables, kept in sync by the batch writer
+partition_tables = set()  # Daily readings tables known to exist (writer thread only)
+latest_partition = None  # Newest daily table with data, read by /stats
 is_network_healthy = True  # Default to online
+stats_cache = None  # Last rendered /stats fragment
+stats_dirty = True  # Set whenever the fragment's inputs change
+index_html = None  # Dashboard page, rendered once at startup
 
 
 # --- CHAOS SIMULATION TASK ---
@@ -38,28 +118,209 @@ async def chaos_monkey_loop():
     """
     Background task that randomly toggles the server health status.
     """
-    global is_network_healthy
+    global is_network_healthy, stats_dirty
     logger.info("Chaos Monkey started internally.")
 
     while True:
         # 1. Stay ONLINE for a random duration
         duration = random.randint(MIN_UP_TIME, MAX_UP_TIME)
         is_network_healthy = True
+        stats_dirty = True
         logger.info(f"Network RESTORED. Online for {duration}s")
         await asyncio.sleep(duration)
 
         # 2. Go OFFLINE for a random duration
         duration = random.randint(MIN_DOWN_TIME, MAX_DOWN_TIME)
         is_network_healthy = False
+        stats_dirty = True
         logger.warning(f"Network SEVERED. Offline for {duration}s")
         await asyncio.sleep(duration)
 
 
+# --- BATCH WRITER TASK ---
+async def run_on_writer(fn, *args):
+    """Runs a blocking call against the writer connection on its own thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_writer_thread, fn, *args)
+
+
+async def flush_pending() -> int:
+    """
+    Drains up to FLUSH_BATCH_SIZE queued readings into a single transaction.
+    Returns the number of readings taken off the queue. If SQLite is busy or
+    locked the batch is kept and retried on the next call, since the agents
+    were already sent a 200.
+    """
+    global row_count, stats_dirty, retry_batch, latest_partition
+    rows, retry_batch = retry_batch, []
+    while len(rows) < FLUSH_BATCH_SIZE:
+        try:
+            rows.append(pending_readings.get_nowait())
+        except asyncio.QueueEmpty:
+            break
+
+    if not rows:
+        return 0
+
+    table = readings_table(utc_today())
+    try:
+        written = await run_on_writer(write_batch, db_connection, rows, table)
+    except sqlite3.OperationalError:
+        retry_batch = rows
+        raise
+    if written:
+        latest_partition = max(latest_partition or table, table)
+    row_count += written
+    stats_dirty = True
+    return len(rows)
+
+
+async def flusher_loop():
+    """
+    Background task that periodically writes queued readings to SQLite,
+    so many agent packets share one commit (and one fsync).
+    """
+    logger.info("Batch writer started.")
+
+    # Stopped via flusher_stop rather than cancel(), so a batch that is being
+    # written always finishes its bookkeeping before shutdown drains the queue.
+    while not flusher_stop.is_set():
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(flusher_stop.wait(), FLUSH_INTERVAL)
+        try:
+            await flush_pending()
+        except Exception:
+            logger.exception("Batch write failed")
+
+
+async def analyze_loop():
+    """
+    Background task that periodically refreshes query planner statistics
+    for the partition currently being written.
+    """
+    while True:
+        await asyncio.sleep(ANALYZE_INTERVAL)
+        try:
+            await run_on_writer(analyze_current_partition, db_connection)
+        except Exception:
+            logger.exception("ANALYZE failed")
+
+
+async def retention_loop():
+    """
+    Background task that drops daily readings tables older than RETENTION_DAYS.
+    The first sweep waits one RETENTION_INTERVAL after startup.
+    """
+    global row_count, stats_dirty, latest_partition
+
+    if RETENTION_DAYS <= 0:
+        logger.info("Retention disabled, keeping all readings.")
+        return
+
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        cutoff = utc_today() - timedelta(days=RETENTION_DAYS)
+        try:
+            dropped = await run_on_writer(drop_partitions_before, db_connection, cutoff)
+        except Exception:
+            logger.exception("Retention sweep failed")
+        else:
+            if latest_partition and latest_partition < readings_table(cutoff):
+                latest_partition = None
+            if dropped:
+                row_count -= dropped
+                stats_dirty = True
+                logger.info(f"Retention: dropped {dropped} readings before {cutoff}")
+
+
 # --- DATABASE LOGIC ---
-async def init_db(conn: aiosqlite.Connection):
-    await conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS readings (
+# Readings are partitioned into one table per UTC day (readings_YYYYMMDD), so
+# /stats only searches today's table and retention is a DROP TABLE.
+PARTITION_GLOB = "readings_[0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9]"
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def readings_table(day: date) -> str:
+    return f"readings_{day:%Y%m%d}"
+
+
+# The writer helpers below are blocking; call them through run_on_writer().
+def open_writer() -> sqlite3.Connection:
+    # isolation_level=None: transactions are opened explicitly in write_batch
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
+    init_db(conn)
+    return conn
+
+
+def init_db(conn: sqlite3.Connection):
+    conn.execute("PRAGMA journal_mode=WAL")
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    partition_tables.update(list_partitions(conn))
+    migrate_legacy_readings(conn)
+
+
+def migrate_legacy_readings(conn: sqlite3.Connection):
+    """
+    One-time move of the pre-partitioning `readings` table into daily tables,
+    keyed by the UTC day each row was received, so the counter and retention
+    cover it.
+    """
+    legacy = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'readings'"
+    ).fetchone()
+    if not legacy:
+        return
+
+    day_expr = "COALESCE(date(received_at), date(timestamp), date('now'))"
+    days = conn.execute(f"SELECT DISTINCT {day_expr} FROM readings").fetchall()
+    with conn:  # COMMIT on success, ROLLBACK on error
+        conn.execute("BEGIN IMMEDIATE")
+        for (day,) in days:
+            table = readings_table(date.fromisoformat(day))
+            ensure_partition(conn, table)
+            conn.execute(
+                f"""
+                INSERT INTO {table}
+                    (agent_id, timestamp, temperature, battery_level, received_at)
+                SELECT agent_id, timestamp, temperature, battery_level, received_at
+                FROM readings WHERE {day_expr} = ? ORDER BY id
+            """,
+                (day,),
+            )
+        conn.execute("DROP TABLE readings")
+    logger.info(f"Migrated legacy readings table into {len(days)} daily tables")
+
+    cutoff = utc_today() - timedelta(days=RETENTION_DAYS)
+    expired = [day for (day,) in days if date.fromisoformat(day) < cutoff]
+    if RETENTION_DAYS > 0 and expired:
+        logger.warning(
+            f"{len(expired)} migrated days are older than RETENTION_DAYS="
+            f"{RETENTION_DAYS} and will be dropped by the first retention sweep "
+            f"in {RETENTION_INTERVAL}s; set RETENTION_DAYS=0 to keep them"
+        )
+
+
+def list_partitions(conn: sqlite3.Connection) -> list[str]:
+    """Returns the names of the daily readings tables, oldest first."""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?"
+        " ORDER BY name",
+        (PARTITION_GLOB,),
+    ).fetchall()
+    return [name for (name,) in rows]
+
+
+def ensure_partition(conn: sqlite3.Connection, table: str):
+    if table in partition_tables:
+        return
+
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {table} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             agent_id TEXT,
             timestamp DATETIME,
@@ -69,17 +330,110 @@ async def init_db(conn: aiosqlite.Connection):
         )
     """
     )
-    await conn.commit()
+    # /stats asks for the newest reading every second; keep that a B-tree descent.
+    conn.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (timestamp DESC)"
+    )
+    partition_tables.add(table)
+
+
+def count_readings(conn: sqlite3.Connection) -> int:
+    return sum(
+        conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in list_partitions(conn)
+    )
+
+
+def drop_partitions_before(conn: sqlite3.Connection, cutoff: date) -> int:
+    """Drops daily tables older than `cutoff`. Returns the number of rows removed."""
+    dropped = 0
+    for table in list_partitions(conn):
+        if table >= readings_table(cutoff):
+            break
+        dropped += conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.execute(f"DROP TABLE {table}")
+        partition_tables.discard(table)
+    return dropped
+
+
+def analyze_current_partition(conn: sqlite3.Connection):
+    # PRAGMA optimize would skip this table: the writer never runs the /stats
+    # query, and the read-only reader cannot write sqlite_stat1.
+    table = readings_table(utc_today())
+    if table not in partition_tables:
+        return
+    conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+    conn.execute(f"ANALYZE {table}")
+
+
+def write_batch(
+    conn: sqlite3.Connection, rows: list[tuple], table: str | None = None
+) -> int:
+    """
+    Inserts `rows` into `table` (default: today's) and returns how many were written.
+    Transient errors (sqlite3.OperationalError: busy, locked, I/O) propagate so
+    the caller can retry the batch. If any other error rejects the batch, the
+    rows are inserted one by one and the failing rows are logged and dropped,
+    so a single bad reading cannot block the ones behind it.
+    """
+    table = table or readings_table(utc_today())
+    ensure_partition(conn, table)
+    insert = f"""
+        INSERT INTO {table} (agent_id, timestamp, temperature, battery_level)
+        VALUES (?, ?, ?, ?)
+    """
+    try:
+        with conn:  # COMMIT on success, ROLLBACK on error
+            # Take the write lock up front rather than upgrading mid-statement
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(insert, rows)
+        return len(rows)
+    except sqlite3.OperationalError:
+        raise
+    except Exception:
+        logger.warning("Batch rejected, inserting row by row", exc_info=True)
+
+    written = 0
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for row in rows:
+            try:
+                conn.execute(insert, row)
+            except sqlite3.OperationalError:
+                raise
+            except Exception as e:
+                logger.error(f"Dropped unwritable reading {row!r}: {e}")
+            else:
+                written += 1
+    return written
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # STARTUP
-    global db_connection
+    global db_connection, db_writer_thread, db_reader, pending_readings, row_count
+    global flusher_stop, latest_partition, index_html
+    # The dashboard page has no per-request data, so render it once
+    index_html = templates.get_template("index.html").render()
+
     logger.info("Initializing Database...")
-    db_connection = await aiosqlite.connect(DB_FILE)
-    db_connection.row_factory = aiosqlite.Row
-    await init_db(db_connection)
+    db_writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+    db_connection = await run_on_writer(open_writer)
+    row_count = await run_on_writer(count_readings, db_connection)
+    partitions = await run_on_writer(list_partitions, db_connection)
+    latest_partition = partitions[-1] if partitions else None
+
+    # Separate connection (and worker thread) so /stats never queues behind inserts
+    db_reader = await aiosqlite.connect(f"file:{DB_FILE}?mode=ro", uri=True)
+    db_reader.row_factory = aiosqlite.Row
+    for pragma in SQLITE_PRAGMAS:
+        await db_reader.execute(pragma)
+
+    pending_readings = asyncio.Queue(maxsize=PENDING_MAX_SIZE)
+    flusher_stop = asyncio.Event()
+    flusher_task = asyncio.create_task(flusher_loop())
+    analyze_task = asyncio.create_task(analyze_loop())
+    retention_task = asyncio.create_task(retention_loop())
 
     # Start Chaos Monkey if enabled
     chaos_task = None
@@ -89,28 +443,47 @@ async def lifespan(app: FastAPI):
     yield  # Application runs
 
     # SHUTDOWN
-    if chaos_task:
-        chaos_task.cancel()
-    logger.info("Closing Database...")
-    await db_connection.close()
-
-
-app = FastAPI(lifespan=lifespan)
+    background_tasks = [t for t in (chaos_task, analyze_task, retention_task) if t]
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+    flusher_stop.set()
+    try:
+        await flusher_task
+        logger.info("Flushing pending readings...")
+        while await flush_pending():
+            pass
+    finally:
+        unsaved = len(retry_batch) + pending_readings.qsize()
+        if unsaved:
+            logger.error(f"Shutting down with {unsaved} unsaved readings")
+        logger.info("Closing Database...")
+        await db_reader.close()
+        await run_on_writer(db_connection.close)
+        db_writer_thread.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 
 # --- DATA MODELS ---
-class TelemetryData(BaseModel):
+class TelemetryData(msgspec.Struct):
     agent_id: str
     timestamp: datetime
     temperature: float
-    battery_level: int
+    battery_level: Annotated[int, msgspec.Meta(ge=0, le=100)]
+
+
+# Decodes and validates the request body in a single pass
+telemetry_decoder = msgspec.json.Decoder(TelemetryData)
 
 
 # --- API ENDPOINTS ---
 
 
 @app.post("/telemetry")
-async def receive_telemetry(data: TelemetryData):
+async def receive_telemetry(request: Request):
     """
     Ingest data. Fails with 503 if Chaos Monkey is active.
     """
@@ -126,18 +499,30 @@ async def receive_telemetry(data: TelemetryData):
     if not db_connection:
         return {"status": "error", "message": "Database not ready"}
 
-    # 3. Save Data (Async)
-    async with db_connection.execute(
-        """
-        INSERT INTO readings (agent_id, timestamp, temperature, battery_level)
-        VALUES (?, ?, ?, ?)
-    """,
-        (data.agent_id, data.timestamp, data.temperature, data.battery_level),
-    ) as cursor:
-        await db_connection.commit()
+    # 3. Validate Payload
+    try:
+        data = telemetry_decoder.decode(await request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+            detail=str(e),
+        )
+
+    # 4. Queue Data (written by the batch writer)
+    try:
+        pending_readings.put_nowait(
+            (data.agent_id, data.timestamp, data.temperature, data.battery_level)
+        )
+    except asyncio.QueueFull:
+        # Writer is behind; let the agent keep the reading in its disk buffer
+        logger.warning("Ingest queue full, rejecting telemetry")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest queue full",
+        )
 
     logger.info(
-        f"Saved: {data.timestamp.strftime('%H:%M:%S')} | Temp: {data.temperature}"
+        f"Queued: {data.timestamp.strftime('%H:%M:%S')} | Temp: {data.temperature}"
     )
     return {"status": "saved"}
 
@@ -145,34 +530,62 @@ async def receive_telemetry(data: TelemetryData):
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Serves the main dashboard page."""
-    return templates.TemplateResponse("index.html", {"request": request})
+    return HTMLResponse(index_html)
+
+
+async def render_stats() -> str:
+    """Builds the /stats fragment from the newest reading and the counters."""
+    rows = []
+    # The newest partition with data, so the last reading stays visible after
+    # UTC midnight until the first flush of the new day
+    if latest_partition:
+        try:
+            rows = await db_reader.execute_fetchall(
+                "SELECT timestamp, temperature, battery_level"
+                f" FROM {latest_partition}"
+                " ORDER BY timestamp DESC LIMIT 1"
+            )
+        except sqlite3.OperationalError as e:
+            # Dropped by retention since latest_partition was read
+            if "no such table" not in str(e):
+                raise
+    latest = rows[0] if rows else None
+
+    # Visualize the 'is_network_healthy' flag
+    status = {
+        "status": "ONLINE" if is_network_healthy else "OFFLINE",
+        "status_color": "#4CAF50" if is_network_healthy else "red",
+    }
+    if latest:
+        return STATS_TEMPLATE.format(
+            count=row_count,
+            timestamp=latest["timestamp"][:19],
+            temperature=latest["temperature"],
+            temp_color="red" if latest["temperature"] > 50 else "#4CAF50",
+            battery_level=latest["battery_level"],
+            **status,
+        )
+    return STATS_WAITING_TEMPLATE.format(count=row_count, **status)
 
 
 @app.get("/stats", response_class=HTMLResponse)
 async def get_stats(request: Request):
     """
     Returns a partial HTML snippet with the latest stats.
-    Non-blocking DB queries.
+    Non-blocking DB queries, re-run only after new data arrives.
     """
-    if not db_connection:
+    global stats_cache, stats_dirty
+    if not db_reader:
         return "Database Error"
 
-    async with db_connection.execute("SELECT COUNT(*) FROM readings") as cursor:
-        row = await cursor.fetchone()
-        count = row[0] if row else 0
-
-    async with db_connection.execute(
-        "SELECT * FROM readings ORDER BY timestamp DESC LIMIT 1"
-    ) as cursor:
-        latest = await cursor.fetchone()
-
-    # Pass the 'is_network_healthy' status to the template so we can visualize it!
-    return templates.TemplateResponse(
-        "stats_fragment.html",
-        {
-            "request": request,
-            "count": count,
-            "latest": latest,
-            "online": is_network_healthy,  # New context variable
-        },
-    )
\ No newline at end of file
+    if not stats_dirty and stats_cache is not None:
+        return HTMLResponse(stats_cache)
+
+    # Clear before querying so a flush landing mid-render marks it dirty again
+    stats_dirty = False
+    try:
+        stats_cache = await render_stats()
+    except Exception:
+        stats_dirty = True
+        raise
+    return HTMLResponse(stats_cache)
\ No newline at end of file
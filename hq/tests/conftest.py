@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pytest
+
+import main
+
+TODAY = date(2026, 3, 15)
+
+
+@pytest.fixture
+def writer(tmp_path, monkeypatch):
+    """Opens the writer connection on its own thread against a temp database."""
+    monkeypatch.setattr(main, "DB_FILE", str(tmp_path / "telemetry.db"))
+    monkeypatch.setattr(main, "partition_tables", set())
+    monkeypatch.setattr(main, "utc_today", lambda: TODAY)
+    monkeypatch.setattr(main, "row_count", 0)
+
+    thread = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "db_writer_thread", thread)
+    conn = thread.submit(main.open_writer).result()
+    monkeypatch.setattr(main, "db_connection", conn)
+    yield conn
+    thread.submit(conn.close).result()
+    thread.shutdown()
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import datetime, timezone
+
+import msgspec
+import pytest
+
+import main
+
+
+def reading(battery_level=85):
+    return ("agent-001", datetime.now(timezone.utc), 23.5, battery_level)
+
+
+def test_bad_reading_does_not_block_later_batches(writer, monkeypatch):
+    monkeypatch.setattr(main, "retry_batch", [])
+
+    async def flush_twice():
+        main.pending_readings = asyncio.Queue()
+        # Too large for an SQLite INTEGER; rejects the whole executemany
+        main.pending_readings.put_nowait(reading(battery_level=2**64 - 1))
+        main.pending_readings.put_nowait(reading())
+        await main.flush_pending()
+
+        main.pending_readings.put_nowait(reading())
+        await main.flush_pending()
+
+    monkeypatch.setattr(main, "pending_readings", None)
+    asyncio.run(flush_twice())
+
+    assert main.retry_batch == []
+    assert main.row_count == 2
+    count = main.db_writer_thread.submit(main.count_readings, writer).result()
+    assert count == 2
+
+
+def test_decoder_rejects_out_of_range_battery_level():
+    payload = (
+        b'{"agent_id": "agent-001", "timestamp": "2026-03-15T10:00:00Z",'
+        b' "temperature": 23.5, "battery_level": 18446744073709551615}'
+    )
+    with pytest.raises(msgspec.ValidationError, match="battery_level"):
+        main.telemetry_decoder.decode(payload)
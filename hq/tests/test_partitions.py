@@ -0,0 +1,184 @@
+import asyncio
+import sqlite3
+from datetime import date, datetime, timezone
+
+import aiosqlite
+import pytest
+
+import main
+
+from conftest import TODAY
+
+
+def on_writer(fn, *args):
+    return main.db_writer_thread.submit(fn, main.db_connection, *args).result()
+
+
+def reading(agent_id="agent-001", temperature=23.5):
+    return (agent_id, datetime.now(timezone.utc), temperature, 85)
+
+
+def table_names(conn):
+    return main.db_writer_thread.submit(main.list_partitions, conn).result()
+
+
+def test_write_batch_routes_to_todays_table(writer):
+    on_writer(main.write_batch, [reading(), reading()])
+
+    assert table_names(writer) == ["readings_20260315"]
+    assert on_writer(main.count_readings) == 2
+
+
+def test_drop_partitions_before_removes_only_older_tables(writer, monkeypatch):
+    for day in (date(2026, 3, 13), date(2026, 3, 14), TODAY):
+        monkeypatch.setattr(main, "utc_today", lambda day=day: day)
+        on_writer(main.write_batch, [reading()])
+
+    assert on_writer(main.drop_partitions_before, date(2026, 3, 14)) == 1
+    assert table_names(writer) == ["readings_20260314", "readings_20260315"]
+    assert "readings_20260313" not in main.partition_tables
+
+
+def test_retention_loop_adjusts_row_count(writer, monkeypatch):
+    monkeypatch.setattr(main, "utc_today", lambda: date(2026, 1, 1))
+    on_writer(main.write_batch, [reading(), reading(), reading()])
+    monkeypatch.setattr(main, "utc_today", lambda: TODAY)
+    on_writer(main.write_batch, [reading()])
+    monkeypatch.setattr(main, "row_count", 4)
+    monkeypatch.setattr(main, "stats_dirty", False)
+    monkeypatch.setattr(main, "RETENTION_INTERVAL", 0.05)
+
+    async def sweep_once():
+        task = asyncio.create_task(main.retention_loop())
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    asyncio.run(sweep_once())
+
+    assert main.row_count == 1
+    assert main.stats_dirty
+    assert table_names(writer) == ["readings_20260315"]
+
+
+def test_legacy_readings_table_is_migrated(tmp_path, monkeypatch):
+    db_file = tmp_path / "telemetry.db"
+    legacy = sqlite3.connect(db_file)
+    legacy.execute(
+        """
+        CREATE TABLE readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            agent_id TEXT,
+            timestamp DATETIME,
+            temperature REAL,
+            battery_level INTEGER,
+            received_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    legacy.executemany(
+        "INSERT INTO readings (agent_id, timestamp, temperature, battery_level,"
+        " received_at) VALUES (?, ?, ?, ?, ?)",
+        [
+            ("agent-001", "2026-03-13 23:59:00+00:00", 20.0, 90, "2026-03-14 00:00:01"),
+            ("agent-001", "2026-03-14 10:00:00+00:00", 21.0, 89, "2026-03-14 10:00:01"),
+            ("agent-001", "2026-03-15 10:00:00+00:00", 22.0, 88, "2026-03-15 10:00:01"),
+        ],
+    )
+    legacy.commit()
+    legacy.close()
+
+    monkeypatch.setattr(main, "DB_FILE", str(db_file))
+    monkeypatch.setattr(main, "partition_tables", set())
+    conn = main.open_writer()
+    try:
+        assert main.list_partitions(conn) == ["readings_20260314", "readings_20260315"]
+        assert main.count_readings(conn) == 3
+        legacy_left = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'readings'"
+        ).fetchone()
+        assert legacy_left is None
+    finally:
+        conn.close()
+
+
+async def render_with_reader():
+    main.db_reader = await aiosqlite.connect(f"file:{main.DB_FILE}?mode=ro", uri=True)
+    main.db_reader.row_factory = aiosqlite.Row
+    try:
+        return await main.render_stats()
+    finally:
+        await main.db_reader.close()
+
+
+async def flush(*rows):
+    main.pending_readings = asyncio.Queue()
+    for row in rows:
+        main.pending_readings.put_nowait(row)
+    await main.flush_pending()
+
+
+@pytest.fixture
+def stats_state(monkeypatch):
+    monkeypatch.setattr(main, "db_reader", None)
+    monkeypatch.setattr(main, "pending_readings", None)
+    monkeypatch.setattr(main, "retry_batch", [])
+    monkeypatch.setattr(main, "latest_partition", None)
+    monkeypatch.setattr(main, "is_network_healthy", False)
+
+
+def test_stats_waits_for_first_reading(writer, stats_state):
+    html = asyncio.run(render_with_reader())
+    assert "Waiting for first contact" in html
+    assert "OFFLINE" in html
+
+    asyncio.run(flush(reading(temperature=61.0)))
+    html = asyncio.run(render_with_reader())
+    assert "61.0°C" in html
+    assert "color: red" in html
+
+
+def test_stats_keeps_last_reading_after_day_rollover(writer, stats_state, monkeypatch):
+    asyncio.run(flush(reading(temperature=42.0)))
+    monkeypatch.setattr(main, "utc_today", lambda: date(2026, 3, 16))
+
+    html = asyncio.run(render_with_reader())
+    assert "42.0°C" in html
+    assert "Total Packets Received:</span>\n    <span class=\"value\">1<" in html
+
+
+def test_stats_errors_are_not_cached(monkeypatch):
+    class LockedReader:
+        async def execute_fetchall(self, sql):
+            raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(main, "db_reader", LockedReader())
+    monkeypatch.setattr(main, "latest_partition", "readings_20260315")
+    monkeypatch.setattr(main, "stats_cache", None)
+    monkeypatch.setattr(main, "stats_dirty", True)
+
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        asyncio.run(main.get_stats(None))
+    assert main.stats_dirty
+    assert main.stats_cache is None
+
+
+def test_analyze_writes_stats_for_todays_partition(writer):
+    on_writer(main.write_batch, [reading() for _ in range(50)])
+    on_writer(main.analyze_current_partition)
+
+    stats = main.db_writer_thread.submit(
+        lambda: writer.execute("SELECT tbl, idx FROM sqlite_stat1").fetchall()
+    ).result()
+    assert ("readings_20260315", "idx_readings_20260315_ts") in stats
+
+
+def test_retention_days_zero_keeps_everything(writer, monkeypatch):
+    monkeypatch.setattr(main, "utc_today", lambda: date(2020, 1, 1))
+    on_writer(main.write_batch, [reading()])
+    monkeypatch.setattr(main, "utc_today", lambda: TODAY)
+    monkeypatch.setattr(main, "RETENTION_DAYS", 0)
+    monkeypatch.setattr(main, "RETENTION_INTERVAL", 0)
+
+    asyncio.run(asyncio.wait_for(main.retention_loop(), 1))
+
+    assert table_names(writer) == ["readings_20200101"]